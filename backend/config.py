@@ -72,12 +72,6 @@ class Settings(BaseSettings):
         description="Minimum plain similarity score for plain jewelry"
     )
 
-    # Vector Database Configuration
-    qdrant_collection_name: str = Field(
-        default="jewellery_images",
-        description="Qdrant collection name"
-    )
-
     # Jewelry Categories
     categories: str = Field(
         default="ring,necklace",
@@ -66,7 +66,11 @@ async def initialize_search_engine() -> JewelrySearchEngine:
         data_root=data_root,
         zip_path=zip_path,
         categories=["ring", "necklace"],
-        device="cuda" if torch.cuda.is_available() else "cpu"
+        device="cuda" if torch.cuda.is_available() else "cpu",
+        compile_model=os.getenv("TORCH_COMPILE", "false").lower() == "true",
+        index_quantization=os.getenv("INDEX_QUANTIZATION", "fp16").lower(),
+        quantize_cpu_model=os.getenv("CPU_INT8_QUANTIZE", "false").lower() == "true",
+        cpu_bf16_autocast=os.getenv("CPU_BF16_AUTOCAST", "false").lower() == "true"
     )
     
     # Initialize (load model and index images)
@@ -5,8 +5,38 @@ Download Tanishq Jewellery Dataset from Kaggle
 import kagglehub
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png'}
+
+def _place(src, dst):
+    """Hardlink src to dst (a metadata-only op), falling back to a copy across filesystems"""
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # Re-run: leave an earlier hardlink alone, overwrite anything else
+        if not os.path.samefile(src, dst):
+            shutil.copy2(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def _place_all(pairs):
+    """Place (src, dst) pairs on a thread pool to overlap the per-file syscall latency"""
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        list(executor.map(lambda pair: _place(*pair), pairs))
+
+def _count_images(directory):
+    """Count image files with a single scandir pass (no Path objects or lists built), 0 if missing"""
+    if not os.path.isdir(directory):
+        # A category absent from the source never gets its destination created
+        return 0
+    with os.scandir(directory) as entries:
+        return sum(
+            1 for e in entries
+            if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_SUFFIXES
+        )
+
 def download_dataset(use_kaggle_api=True):
     print("🚀 Downloading Tanishq Jewellery Dataset from Kaggle...")
     print("📦 This may take a few minutes on first run...\n")
@@ -37,6 +67,9 @@ def download_dataset(use_kaggle_api=True):
             source_path = source_path / "Jewellery_Data"
             print(f"📂 Using: {source_path}")
         
+        # (src, dst) pairs, placed in parallel once collected
+        pairs = []
+        
         # Check for common dataset structures
         # Option 1: Images already organized by category
         if (source_path / "ring").exists():
@@ -46,8 +79,8 @@ def download_dataset(use_kaggle_api=True):
             
             # Copy all ring images
             for img in (source_path / "ring").glob("*"):
-                if img.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                    shutil.copy2(img, ring_dest / img.name)
+                if img.suffix.lower() in IMAGE_SUFFIXES:
+                    pairs.append((img, ring_dest / img.name))
         
         if (source_path / "necklace").exists():
             print("✅ Found 'necklace' category")
@@ -56,10 +89,11 @@ def download_dataset(use_kaggle_api=True):
             
             # Copy all necklace images
             for img in (source_path / "necklace").glob("*"):
-                if img.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                    shutil.copy2(img, necklace_dest / img.name)
+                if img.suffix.lower() in IMAGE_SUFFIXES:
+                    pairs.append((img, necklace_dest / img.name))
         
         # Option 2: All images in one folder - need to organize
+        temp_dir = None
         if not (source_path / "ring").exists() and not (source_path / "necklace").exists():
             print("\n⚠️  Dataset not pre-organized by category")
             print("📋 Copying all images - you may need to organize them manually")
@@ -72,24 +106,19 @@ def download_dataset(use_kaggle_api=True):
             temp_dir = target_dir / "unsorted"
             temp_dir.mkdir(exist_ok=True)
             
-            for item in source_path.rglob("*.jpg"):
-                shutil.copy2(item, temp_dir / item.name)
-            for item in source_path.rglob("*.jpeg"):
-                shutil.copy2(item, temp_dir / item.name)
-            for item in source_path.rglob("*.png"):
-                shutil.copy2(item, temp_dir / item.name)
+            for item in source_path.rglob("*"):
+                if item.suffix.lower() in IMAGE_SUFFIXES:
+                    pairs.append((item, temp_dir / item.name))
             
+        _place_all(pairs)
+        
+        if temp_dir is not None:
             print(f"📁 Images copied to: {temp_dir}")
             print("📝 Please manually organize images into ring/ and necklace/ folders")
         
         # Count images
-        ring_count = len(list((target_dir / "ring").glob("*.jpg"))) + \
-                     len(list((target_dir / "ring").glob("*.jpeg"))) + \
-                     len(list((target_dir / "ring").glob("*.png")))
-        
-        necklace_count = len(list((target_dir / "necklace").glob("*.jpg"))) + \
-                        len(list((target_dir / "necklace").glob("*.jpeg"))) + \
-                        len(list((target_dir / "necklace").glob("*.png")))
+        ring_count = _count_images(target_dir / "ring")
+        necklace_count = _count_images(target_dir / "necklace")
         
         print(f"\n✅ Dataset setup complete!")
         print(f"📊 Statistics:")
@@ -5,13 +5,19 @@ from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse
 import os
 import traceback
-import random
+import numpy as np
 
 from models.schemas import SearchResponse
 from dependencies import get_search_engine
 
 router = APIRouter()
 
+_rng = np.random.default_rng()
+
+# Image ids are positions in the index and shift when the dataset changes, so let browsers
+# cache for a day and then revalidate against FileResponse's mtime/size ETag
+IMAGE_CACHE_CONTROL = "public, max-age=86400"
+
 
 @router.get("/product/{product_id}")
 async def get_product(product_id: int):
@@ -30,7 +36,7 @@ async def get_product(product_id: int):
     
     try:
         # Get product details
-        category = search_engine.image_categories[product_id]
+        category = search_engine.image_category(product_id)
         
         # Generate description using LLM
         description = search_engine.generate_description(product_id, category)
@@ -73,7 +79,9 @@ async def get_image(image_id: int):
     if not os.path.exists(image_path):
         raise HTTPException(status_code=404, detail="Image file not found")
     
-    return FileResponse(image_path, media_type="image/jpeg")
+    return FileResponse(
+        image_path, media_type="image/jpeg", headers={"Cache-Control": IMAGE_CACHE_CONTROL}
+    )
 
 
 @router.get("/featured", response_model=SearchResponse)
@@ -91,24 +99,30 @@ async def get_featured_items(limit: int = 12):
     try:
         # Get random indices
         total = len(search_engine.image_paths)
-        random_indices = random.sample(range(total), min(limit, total))
+        random_indices = _rng.choice(total, size=min(limit, total), replace=False)
         
-        # Format as search results
-        results = []
-        for idx in random_indices:
-            results.append({
+        # Gather the sampled rows from the image columns at once, then format as search results
+        categories = search_engine.categories
+        results = [
+            {
                 "id": idx,
-                "image_path": search_engine.image_paths[idx],
-                "category": search_engine.image_categories[idx],
+                "image_path": path,
+                "category": categories[category_id],
                 "similarity_score": 1.0,
                 "plain_score": None,
                 "decoration_score": None
-            })
+            }
+            for idx, path, category_id in zip(
+                random_indices.tolist(),
+                search_engine.image_paths[random_indices],
+                search_engine.image_category_ids[random_indices].tolist()
+            )
+        ]
         
         return SearchResponse(
             query="Featured items",
             enhanced_query="Explore our jewelry collection",
-            categories=list(set([r["category"] for r in results])),
+            categories=list(dict.fromkeys(r["category"] for r in results)),
             negations=[],
             results=results,
             total_results=len(results),
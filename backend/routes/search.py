@@ -3,7 +3,7 @@ Search and recommendation endpoints
 """
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from PIL import Image
-import io
+import asyncio
 import traceback
 
 from models.schemas import SearchRequest, SearchResponse, RecommendRequest
@@ -12,6 +12,19 @@ from dependencies import get_search_engine
 router = APIRouter()
 
 
+# Uploads are only ever seen by CLIP (224px) and the vision LLM (512px), so
+# decoding beyond this size is wasted work
+UPLOAD_DECODE_SIZE = 1024
+
+
+def _decode_upload(fp) -> Image.Image:
+    """Decode an uploaded image file object to RGB (PIL reads it lazily, no full copy in memory)"""
+    with Image.open(fp) as img:
+        # JPEGs decode at a reduced DCT scale that still covers UPLOAD_DECODE_SIZE (no-op otherwise)
+        img.draft("RGB", (UPLOAD_DECODE_SIZE, UPLOAD_DECODE_SIZE))
+        return img.convert("RGB")
+
+
 @router.post("/search", response_model=SearchResponse)
 async def search(request: SearchRequest):
     """
@@ -94,9 +107,8 @@ async def upload_image(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        # Decode straight from the spooled upload file, off the event loop
+        image = await asyncio.to_thread(_decode_upload, file.file)
         
         # Search by image
         results = await search_engine.search_by_image(image, top_k=top_k)
@@ -132,9 +144,8 @@ async def upload_image_with_text(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        # Decode straight from the spooled upload file, off the event loop
+        image = await asyncio.to_thread(_decode_upload, file.file)
         
         # Search by image + text if query provided, otherwise just image
         if query and query.strip():
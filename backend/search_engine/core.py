@@ -37,12 +37,13 @@ class JewelrySearchEngine(_JewelrySearchEngine):
         top_k: int = 5,
         max_decoration_score: float = 0.25,
         min_plain_score: float = 0.28,
-        semantic_top_k: int = 100
+        semantic_top_k: int = 100,
+        ef_search: Optional[int] = None
     ) -> Dict[str, Any]:
         """Perform semantic search with negation filtering"""
         return await search(
             self, query, categories, top_k,
-            max_decoration_score, min_plain_score, semantic_top_k
+            max_decoration_score, min_plain_score, semantic_top_k, ef_search
         )
     
     async def search_by_image(self, image: Image.Image, top_k: int = 10) -> Dict[str, Any]:
@@ -50,10 +51,15 @@ class JewelrySearchEngine(_JewelrySearchEngine):
         return await search_by_image(self, image, top_k)
     
     async def search_by_image_and_text(
-        self, image: Image.Image, query: str, top_k: int = 10
+        self,
+        image: Image.Image,
+        query: str,
+        top_k: int = 10,
+        detected_type: Optional[str] = None,
+        image_weight: float = 0.6
     ) -> Dict[str, Any]:
         """Search by combining image and text embeddings"""
-        return await search_by_image_and_text(self, image, query, top_k)
+        return await search_by_image_and_text(self, image, query, top_k, detected_type, image_weight)
     
     async def recommend(self, image_id: int, top_k: int = 5) -> Dict[str, Any]:
         """Get recommendations based on image similarity"""
@@ -3,15 +3,63 @@ CLIP-based Jewelry Search Engine - Main Engine Class
 """
 
 import os
+import multiprocessing
+import faiss
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import ZipFile
+import numpy as np
 import torch
-from typing import List
+from PIL import Image
+from typing import List, Optional, Tuple
 from transformers import CLIPProcessor, CLIPModel
-from qdrant_client import QdrantClient
 
 from .handlers.ocr import OCRHandler
 from .handlers.embeddings import EmbeddingHandler
 from .processors.query import QueryProcessor
 from .utils.jewelry import JewelryUtils
+from .utils.cache import DiskCache, LRUCache, SemanticQueryCache
+from .indexing.batcher import SearchBatcher
+from .indexing.builder import binary_codes
+
+# Candidates fetched per requested result when rescoring int8-coded searches
+RESCORE_OVERSAMPLING = 2.0
+
+# Sign-bit codes rank much more coarsely than int8, so binary searches rescore a wider pool
+BINARY_RESCORE_OVERSAMPLING = 4.0
+
+# Set bits per byte value, for Hamming distances over packed codes
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _extract_members(zip_path: str, names: List[str], dest: str):
+    """Extract some members of a zip archive (runs in a worker process with its own handle)"""
+    with ZipFile(zip_path, "r") as z:
+        for name in names:
+            z.extract(name, dest)
+
+
+def _member_dir(dest: str, name: str) -> str:
+    """Directory a zip member lands in, with the same '', '.' and '..' stripping as ZipFile.extract()"""
+    parts = [part for part in name.split("/")[:-1] if part not in ("", os.curdir, os.pardir)]
+    return os.path.join(dest, *parts)
+
+
+def _extract_zip(zip_path: str, dest: str, chunk_size: int = 256):
+    """Extract a zip archive, inflating members in parallel across processes"""
+    with ZipFile(zip_path, "r") as z:
+        names = z.namelist()
+    chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+    
+    # Create every target directory here, so workers never race on mkdir
+    for directory in sorted({_member_dir(dest, name) for name in names}):
+        os.makedirs(directory, exist_ok=True)
+    
+    # spawn, not fork: this process already runs threads (batchers, decode pools), and a
+    # forked child can inherit a lock some other thread was holding
+    with ProcessPoolExecutor(
+        max_workers=min(8, os.cpu_count() or 1), mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        list(executor.map(_extract_members, [zip_path] * len(chunks), chunks, [dest] * len(chunks)))
 
 
 class JewelrySearchEngine:
@@ -23,27 +71,55 @@ class JewelrySearchEngine:
         zip_path: str = "/app/archive.zip",
         categories: List[str] = None,
         device: str = "cpu",
-        model_name: str = "laion/CLIP-ViT-L-14-laion2B-s32B-b82K"
+        model_name: str = "laion/CLIP-ViT-L-14-laion2B-s32B-b82K",
+        compile_model: bool = False,
+        index_quantization: str = "fp16",
+        quantize_cpu_model: bool = False,
+        cpu_bf16_autocast: bool = False
     ):
         self.data_root = data_root
         self.zip_path = zip_path
         self.categories = categories or ["ring", "necklace"]
         self.device = device
         self.model_name = model_name
+        self.compile_model = compile_model
+        if index_quantization not in ("fp16", "int8", "binary"):
+            raise ValueError(f"Unsupported index quantization: {index_quantization}")
+        self.index_quantization = index_quantization
+        self.quantize_cpu_model = quantize_cpu_model
+        self.cpu_bf16_autocast = cpu_bf16_autocast
         
         self.model = None
         self.processor = None
-        self.client = None
-        self.collection_name = "jewellery_images"
+        self.index = None
+        self.binary_codes = None
+        self.category_selectors = {}
+        self.category_masks = {}
+        self.plain_scores = {}
+        self.category_counts = {}
+        
+        # Stage-1 index hits of recent text queries, shared by near-duplicate queries
+        self.query_cache = SemanticQueryCache(maxsize=1024, threshold=0.95)
+        
+        # Concurrent single-vector searches sharing the same options run as one FAISS call
+        self.search_batcher = SearchBatcher(self._index_search)
         
-        self.image_paths = []
-        self.image_categories = []
+        # Image embedding per uploaded image content hash (extracted text lives in llm_text_cache)
+        self.upload_cache = LRUCache(maxsize=512)
+        
+        # Columnar image table, row i is image id i: paths plus an index into self.categories
+        self.image_paths = np.empty(0, dtype=object)
+        self.image_category_ids = np.empty(0, dtype=np.uint8)
         self.image_embeddings = None
         self.total_images = 0
         
         cache_dir = os.path.join(self.data_root, "cache")
         os.makedirs(cache_dir, exist_ok=True)
         
+        # LLM-extracted text per upload content hash, kept on disk so repeat uploads
+        # skip the API call across restarts too
+        self.llm_text_cache = DiskCache(os.path.join(cache_dir, "llm_text.sqlite3"))
+        
         # Initialize modular components (will be set after model loads)
         self.ocr_handler = None
         self.embedding_handler = None
@@ -58,23 +134,47 @@ class JewelrySearchEngine:
         self.model = CLIPModel.from_pretrained(self.model_name).to(self.device)
         self.processor = CLIPProcessor.from_pretrained(self.model_name)
         self.model.eval()
-        print(f"✅ Model loaded on {self.device}")
+        if self.device.startswith("cuda"):
+            # Match the fp16 autocast used for every forward, avoiding per-op weight casts
+            self.model.half()
+        
+        # Numeric precision of every forward. bf16 autocast on CPU is opt-in: without
+        # AVX512-BF16/AMX it is slower and less precise than fp32
+        if self.device.startswith("cuda"):
+            precision = "fp16"
+        elif self.device == "cpu" and self.quantize_cpu_model:
+            # int8 dynamic quantization of the Linear layers (VNNI dot products on x86).
+            # Quantized Linears take float32 activations, so autocast stays off
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            precision = "int8"
+            print("✅ CLIP Linear layers quantized to int8")
+        elif self.device == "cpu" and self.cpu_bf16_autocast:
+            precision = "bf16"
+        else:
+            precision = "fp32"
+        autocast = precision in ("fp16", "bf16")
+        print(f"✅ Model loaded on {self.device} ({precision})")
         
         # Initialize modular components
         cache_dir = os.path.join(self.data_root, "cache")
         self.ocr_handler = OCRHandler()
         self.embedding_handler = EmbeddingHandler(
-            self.model, self.processor, self.device, self.model_name, cache_dir
+            self.model, self.processor, self.device, self.model_name, cache_dir,
+            autocast=autocast, precision=precision
         )
         self.query_processor = QueryProcessor(self.categories)
-        self.jewelry_utils = JewelryUtils(self.model, self.processor, self.device)
+        self.jewelry_utils = JewelryUtils(self.model, self.processor, self.device, autocast=autocast)
+        
+        # Compile the CLIP towers before indexing, so the corpus pass runs compiled too
+        if self.compile_model:
+            self._compile_model()
         
         # Extract dataset if needed
-        from zipfile import ZipFile
         if os.path.exists(self.zip_path) and not os.path.exists(os.path.join(self.data_root, "Jewellery_Data")):
             print("Extracting dataset...")
-            with ZipFile(self.zip_path, "r") as z:
-                z.extractall(self.data_root)
+            _extract_zip(self.zip_path, self.data_root)
             print("✅ Dataset extracted")
         
         # Load images
@@ -82,10 +182,139 @@ class JewelrySearchEngine:
         
         # Build vector index
         await build_index(self)
+        
+        # Decoration terms for the common negations go straight into the text embedding cache
+        self._warm_negation_terms()
+    
+    def _warm_negation_terms(self):
+        """Embed every category's decoration terms for the common negations in one batch"""
+        terms = [
+            term
+            for category in self.categories
+            for term in self.query_processor.get_decoration_terms(category, QueryProcessor.COMMON_NEGATIONS)
+        ]
+        self.embedding_handler.embed_texts(terms)
+    
+    def _compile_model(self):
+        """Wrap the CLIP text and vision towers with torch.compile (PyTorch >= 2.0)"""
+        if not hasattr(torch, "compile"):
+            print("⚠️  torch.compile requires PyTorch >= 2.0, running eager")
+            return
+        
+        text_model, vision_model = self.model.text_model, self.model.vision_model
+        try:
+            # Text batches vary in size and padded length (TextBatcher, padding=True), so the
+            # text tower is compiled shape-polymorphic instead of recompiling per shape
+            self.model.text_model = torch.compile(text_model, dynamic=True)
+            # Default mode, not reduce-overhead: CUDA graph replays share static output buffers,
+            # and concurrent uploads embed on several worker threads at once
+            self.model.vision_model = torch.compile(vision_model)
+            
+            # Compilation is lazy: run one query-shaped forward per tower now so the first
+            # request doesn't pay for it (and so compile failures surface here)
+            height, width = self.embedding_handler._crop_hw
+            self.embedding_handler.embed_image(Image.new("RGB", (width, height)))
+            self.embedding_handler.embed_texts(JewelryUtils.TYPE_QUERIES)
+            print("✅ CLIP text and vision towers compiled")
+        except Exception as e:
+            self.model.text_model, self.model.vision_model = text_model, vision_model
+            print(f"⚠️  torch.compile unavailable ({e}), running eager")
+    
+    def image_category(self, image_id: int) -> str:
+        """Category name of a single image"""
+        return self.categories[self.image_category_ids[image_id]]
+    
+    def search_index(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        category: Optional[str] = None,
+        ef_search: Optional[int] = None,
+        categories: Optional[List[str]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Return (image_id, score) pairs for the nearest images, optionally within one category
+        (or any of several categories).
+        ef_search overrides the HNSW search breadth (ignored for flat and binary indexes).
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        
+        # Embeddings are unit-norm, so inner product is cosine similarity
+        query = np.ascontiguousarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        
+        wanted = None
+        if category is not None or categories is not None:
+            wanted = [category] if category is not None else categories
+        
+        if self.index_quantization == "binary":
+            return self._search_binary(query[0], limit, wanted)
+        
+        if wanted is not None and not any(c in self.category_selectors for c in wanted):
+            return []
+        
+        if self.index_quantization != "int8":
+            options = (min(limit, self.index.ntotal), tuple(wanted) if wanted else None, ef_search)
+            scores, ids = self.search_batcher.search(query[0], options)
+            return [(int(i), float(s)) for i, s in zip(ids, scores) if i >= 0]
+        
+        # int8 codes rank approximately: oversample, then rescore the candidates exactly
+        # against the stored float16 embeddings
+        k = min(int(np.ceil(limit * RESCORE_OVERSAMPLING)), self.index.ntotal)
+        _, ids = self.search_batcher.search(query[0], (k, tuple(wanted) if wanted else None, ef_search))
+        return self._rescore(ids[ids >= 0], query[0], limit)
+    
+    def _index_search(self, queries: np.ndarray, options: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+        """Run one FAISS search for a (n, D) batch of queries sharing (k, categories, ef_search)"""
+        k, categories, ef_search = options
+        
+        selector = None
+        if categories is not None:
+            selectors = [self.category_selectors[c] for c in categories if c in self.category_selectors]
+            
+            # OR the prebuilt per-category selectors; the list keeps every one alive for the search
+            selector = selectors[0]
+            for other in selectors[1:]:
+                selector = faiss.IDSelectorOr(selector, other)
+                selectors.append(selector)
+        
+        params = None
+        if isinstance(self.index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW(efSearch=ef_search or self.index.hnsw.efSearch, sel=selector)
+        elif selector is not None:
+            params = faiss.SearchParameters(sel=selector)
+        
+        return self.index.search(queries, k, params=params)
+    
+    def _search_binary(
+        self, query: np.ndarray, limit: int, categories: Optional[List[str]]
+    ) -> List[Tuple[int, float]]:
+        """Hamming search over sign-bit codes, then exact rescoring of the oversampled candidates"""
+        codes = binary_codes(query.reshape(1, -1))
+        
+        if categories is None:
+            k = min(int(np.ceil(limit * BINARY_RESCORE_OVERSAMPLING)), self.index.ntotal)
+            _, ids = self.index.search(codes, k)
+            return self._rescore(ids[0][ids[0] >= 0], query, limit)
+        
+        # Binary indexes take no id selector, so filtered searches scan the wanted
+        # categories' codes directly (a byte-table popcount over N x D/8 bytes)
+        masks = [self.category_masks[c] for c in categories if c in self.category_masks]
+        if not masks:
+            return []
+        candidates = np.flatnonzero(np.logical_or.reduce(masks))
+        if len(candidates) == 0:
+            return []
+        distances = _POPCOUNT[self.binary_codes[candidates] ^ codes].sum(axis=1, dtype=np.int32)
+        k = min(int(np.ceil(limit * BINARY_RESCORE_OVERSAMPLING)), len(candidates))
+        return self._rescore(candidates[np.argpartition(distances, k - 1)[:k]], query, limit)
+    
+    def _rescore(self, ids: np.ndarray, query: np.ndarray, limit: int) -> List[Tuple[int, float]]:
+        """Exact cosine of candidate ids against the stored float16 embeddings, best limit first"""
+        scores = self.image_embeddings[ids].astype(np.float32) @ query
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return [(int(ids[j]), float(scores[j])) for j in order]
     
     def get_category_counts(self):
-        """Get image counts per category"""
-        counts = {}
-        for category in self.categories:
-            counts[category] = self.image_categories.count(category)
-        return counts
+        """Get image counts per category (computed once when the index is built)"""
+        return dict(self.category_counts)
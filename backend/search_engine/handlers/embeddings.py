@@ -5,111 +5,288 @@ Includes caching functionality for performance optimization
 
 import os
 import hashlib
-import pickle
+import json
 import numpy as np
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from torchvision.transforms import v2, InterpolationMode
 from tqdm import tqdm
-from typing import List, Optional
+from typing import List, Optional, Tuple
+
+from ..utils.cache import LRUCache
+from ..utils.inference import inference_context, unit_features
+from .text_batcher import TextBatcher
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+    TURBOJPEG_AVAILABLE = True
+except Exception:
+    # Missing package or missing libturbojpeg shared library
+    TURBOJPEG_AVAILABLE = False
+    print("ℹ️  PyTurboJPEG not available. JPEG decoding will use PIL.")
+
+
+def _load_rgb(path: str) -> Image.Image:
+    """Open and decode an image file as RGB (runs on the decode pool)"""
+    with Image.open(path) as img:
+        return img.convert("RGB")
+
+
+def _decode_jpeg(path: str) -> Optional[torch.Tensor]:
+    """Decode a JPEG straight to a (3, H, W) uint8 tensor with libjpeg-turbo, None if unsupported"""
+    if not TURBOJPEG_AVAILABLE or not path.lower().endswith((".jpg", ".jpeg")):
+        return None
+    try:
+        with open(path, "rb") as f:
+            rgb = _turbo_jpeg.decode(f.read(), pixel_format=TJPF_RGB)
+        return torch.from_numpy(rgb).permute(2, 0, 1)
+    except Exception:
+        # Let PIL handle anything libjpeg-turbo rejects (CMYK, mislabelled PNGs, ...)
+        return None
 
 
 class EmbeddingHandler:
     """Handles CLIP embeddings with caching support"""
     
-    def __init__(self, model, processor, device: str, model_name: str, cache_dir: str):
+    def __init__(
+        self, model, processor, device: str, model_name: str, cache_dir: str,
+        autocast: bool = True, precision: str = "fp32"
+    ):
         self.model = model
         self.processor = processor
         self.device = device
+        self.autocast = autocast
         self.model_name = model_name
+        # Inference precision label (fp32, fp16, bf16, int8); embeddings differ across them
+        self.precision = precision
         self.cache_dir = cache_dir
         os.makedirs(self.cache_dir, exist_ok=True)
+        
+        # PIL releases the GIL while decoding, so threads overlap JPEG decode
+        self._decode_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        
+        # CLIP preprocessing as tensor ops, using the processor's own constants: the
+        # resize/crop runs per image on the decode pool, the normalize runs batched on device
+        image_processor = processor.image_processor
+        crop_size = image_processor.crop_size
+        self._crop_hw = (crop_size["height"], crop_size["width"])
+        self._shortest_edge = image_processor.size["shortest_edge"]
+        self._resize_crop = v2.Compose([
+            v2.Resize(
+                self._shortest_edge,
+                interpolation=InterpolationMode.BICUBIC,
+                antialias=True
+            ),
+            v2.CenterCrop(self._crop_hw)
+        ])
+        self._normalize = v2.Compose([
+            v2.ToDtype(torch.float32, scale=True),
+            v2.Normalize(mean=image_processor.image_mean, std=image_processor.image_std)
+        ])
+        
+        # Staging buffer for uint8 batches, reused across batches (pinned for async H2D on CUDA)
+        self._pixel_buffer = None
+        
+        # Query/term strings repeat heavily across searches; keep their embeddings around
+        self._text_emb_cache = LRUCache(maxsize=4096)
+        
+        # Concurrent searches' cache misses share one text-encoder forward
+        self._text_batcher = TextBatcher(self._encode_texts, max_batch=32, max_wait_ms=5)
+    
+    def _to_pixels(self, image: Image.Image) -> torch.Tensor:
+        """Resize and center-crop a PIL image into a (3, H, W) uint8 tensor"""
+        # Box-reduce large photos in PIL first (keeping at least 2x the target edge), so the
+        # antialiased resize works on a few hundred pixels instead of a 12MP image
+        factor = min(image.size) // (2 * self._shortest_edge)
+        if factor >= 2:
+            image = image.reduce(factor)
+        return self._resize_crop(v2.functional.pil_to_tensor(image.convert("RGB")))
     
-    def get_cache_key(self, image_paths: List[str]) -> str:
-        """Generate cache key based on image paths and model"""
-        paths_str = "|".join(sorted(image_paths))
-        key_str = f"{self.model_name}_{paths_str}"
-        return hashlib.md5(key_str.encode()).hexdigest()
+    def _load_pixels(self, path: str) -> torch.Tensor:
+        """Decode an image file and resize/crop it (runs on the decode pool)"""
+        pixels = _decode_jpeg(path)
+        if pixels is not None:
+            return self._resize_crop(pixels)
+        return self._to_pixels(_load_rgb(path))
     
-    def load_embeddings_cache(self, image_paths: List[str]) -> Optional[np.ndarray]:
-        """Load embeddings from cache if available"""
-        cache_key = self.get_cache_key(image_paths)
-        cache_file = os.path.join(self.cache_dir, f"embeddings_{cache_key}.pkl")
+    def _embed_pixels(self, pixels: torch.Tensor) -> torch.Tensor:
+        """Normalize a (N, 3, H, W) uint8 batch on device and return unit-norm image features"""
+        pixel_values = self._normalize(pixels.to(self.device, non_blocking=True))
         
-        if os.path.exists(cache_file):
+        with inference_context(self.device, self.autocast):
+            feats = unit_features(self.model.get_image_features(pixel_values=pixel_values))
+        
+        return feats
+    
+    def get_cache_key(self) -> str:
+        """Generate cache key for the current model (one cache file per model and precision)"""
+        return hashlib.blake2b(f"{self.model_name}:{self.precision}".encode(), digest_size=16).hexdigest()
+    
+    def _cache_files(self):
+        """Return the (embeddings, path list) cache file pair for the current model"""
+        base = os.path.join(self.cache_dir, f"embeddings_{self.get_cache_key()}")
+        return f"{base}.npy", f"{base}.json"
+    
+    @staticmethod
+    def _image_mtimes(image_paths: List[str]) -> List[int]:
+        """Modification time of every image, used to detect files changed since caching"""
+        return [os.stat(path).st_mtime_ns for path in image_paths]
+    
+    def load_embeddings_cache(
+        self, image_paths: List[str], mtimes: List[int]
+    ) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """Load cached embeddings (memory-mapped, pages load on demand)
+        
+        Returns the cached matrix and, for each of image_paths, the row holding its
+        embedding, or -1 when the image is new or was modified after it was cached.
+        """
+        cache_file, paths_file = self._cache_files()
+        no_rows = np.full(len(image_paths), -1, dtype=np.int64)
+        
+        if os.path.exists(cache_file) and os.path.exists(paths_file):
             try:
                 print(f"Loading embeddings from cache...")
-                with open(cache_file, "rb") as f:
-                    cached_data = pickle.load(f)
-                    if len(cached_data) == len(image_paths):
-                        print(f"✅ Loaded {len(cached_data)} embeddings from cache")
-                        return cached_data
-                    else:
-                        print(f"⚠️  Cache size mismatch, recomputing...")
+                with open(paths_file, "r") as f:
+                    meta = json.load(f)
+                cached_paths, cached_mtimes = meta["paths"], meta["mtimes"]
+                
+                # Validate against the sidecar first, the matrix itself is only opened if usable
+                if meta.get("model") != self.model_name or meta.get("precision") != self.precision \
+                        or meta.get("n") != len(cached_paths) \
+                        or len(cached_mtimes) != len(cached_paths):
+                    print(f"⚠️  Cache is not usable, recomputing...")
+                    return None, no_rows
+                
+                cached_data = np.load(cache_file, mmap_mode="r")
+                if cached_data.dtype != np.float16 or cached_data.shape != (meta["n"], meta["dim"]):
+                    print(f"⚠️  Cache is not usable, recomputing...")
+                    return None, no_rows
+                
+                # Map each current (path, mtime) to its row in the cached matrix
+                row_of = {(p, m): i for i, (p, m) in enumerate(zip(cached_paths, cached_mtimes))}
+                rows = np.fromiter(
+                    (row_of.get(key, -1) for key in zip(image_paths, mtimes)),
+                    dtype=np.int64, count=len(image_paths)
+                )
+                print(f"✅ Found {int((rows >= 0).sum())}/{len(rows)} embeddings in cache")
+                return cached_data, rows
             except Exception as e:
                 print(f"⚠️  Error loading cache: {e}, recomputing...")
-        return None
+        return None, no_rows
     
-    def save_embeddings_cache(self, embeddings: np.ndarray, image_paths: List[str]):
-        """Save embeddings to cache"""
-        cache_key = self.get_cache_key(image_paths)
-        cache_file = os.path.join(self.cache_dir, f"embeddings_{cache_key}.pkl")
+    def save_embeddings_cache(self, embeddings: np.ndarray, image_paths: List[str], mtimes: List[int]):
+        """Save embeddings to cache along with the path and mtime of each row"""
+        cache_file, paths_file = self._cache_files()
         
         try:
-            with open(cache_file, "wb") as f:
-                pickle.dump(embeddings, f)
+            # Write-then-rename: an earlier cache may still be memory-mapped, and a crash
+            # mid-write must not leave a truncated cache behind
+            with open(f"{cache_file}.tmp", "wb") as f:
+                np.save(f, embeddings)
+            with open(f"{paths_file}.tmp", "w") as f:
+                json.dump({
+                    "model": self.model_name,
+                    "precision": self.precision,
+                    "n": int(embeddings.shape[0]),
+                    "dim": int(embeddings.shape[1]),
+                    "paths": list(image_paths),
+                    "mtimes": list(mtimes)
+                }, f)
+            os.replace(f"{cache_file}.tmp", cache_file)
+            os.replace(f"{paths_file}.tmp", paths_file)
             print(f"✅ Saved embeddings to cache")
         except Exception as e:
             print(f"⚠️  Error saving cache: {e}")
     
+    def embed_images_cached(self, image_paths: List[str], batch_size: int = 8) -> np.ndarray:
+        """Embed images, reusing cached embeddings and running CLIP only on new or changed files"""
+        if len(image_paths) == 0:
+            # Nothing to embed, and an empty dataset must not overwrite a good cache
+            return self.embed_images_batch(image_paths, batch_size=batch_size)
+        
+        mtimes = self._image_mtimes(image_paths)
+        cached_data, rows = self.load_embeddings_cache(image_paths, mtimes)
+        
+        hits = np.flatnonzero(rows >= 0)
+        if len(hits) == len(image_paths):
+            # Full hit: serve straight from the memory map unless rows need reordering
+            if np.array_equal(rows, np.arange(len(rows))):
+                return cached_data
+            return cached_data[rows]
+        
+        stale = np.flatnonzero(rows < 0)
+        print(f"Computing image embeddings for {len(stale)} new or changed images...")
+        fresh = self.embed_images_batch([image_paths[i] for i in stale], batch_size=batch_size)
+        
+        embeddings = np.empty((len(image_paths), fresh.shape[1]), dtype="float16")
+        if len(hits) > 0:
+            embeddings[hits] = cached_data[rows[hits]]
+        embeddings[stale] = fresh
+        
+        self.save_embeddings_cache(embeddings, image_paths, mtimes)
+        return embeddings
+    
     def embed_images_batch(self, paths: List[str], batch_size: int = 8) -> np.ndarray:
-        """Embed images in batches"""
+        """Embed images in batches, returns float16 (cosine ranking is unaffected, half the memory)"""
+        embedding_size = self.model.config.projection_dim  # 768 for CLIP-ViT-L
         if len(paths) == 0:
             print("⚠️  No images to embed - returning empty array")
-            # Return empty array with correct dimensions
-            dummy_embedding_size = 768  # CLIP embedding size
-            return np.zeros((0, dummy_embedding_size), dtype="float32")
-        
-        all_embs = []
-        for i in tqdm(range(0, len(paths), batch_size), desc="Embedding images"):
-            batch_paths = paths[i:i+batch_size]
-            images = [Image.open(p).convert("RGB") for p in batch_paths]
-            inputs = self.processor(images=images, return_tensors="pt").to(self.device)
-            
-            with torch.no_grad():
-                image_features = self.model.get_image_features(**inputs)
-                feats = image_features.pooler_output if hasattr(image_features, 'pooler_output') else image_features
-                feats = feats / feats.norm(dim=-1, keepdim=True)
+            return np.zeros((0, embedding_size), dtype="float16")
+        
+        batches = [paths[i:i+batch_size] for i in range(0, len(paths), batch_size)]
+        
+        # Each batch is written straight into one preallocated result matrix
+        out = np.empty((len(paths), embedding_size), dtype="float16")
+        
+        buffer_shape = (batch_size, 3, *self._crop_hw)
+        if self._pixel_buffer is None or tuple(self._pixel_buffer.shape) != buffer_shape:
+            self._pixel_buffer = torch.empty(
+                buffer_shape, dtype=torch.uint8, pin_memory=self.device.startswith("cuda")
+            )
+        
+        # Decode the next batch on the pool while the current one runs through CLIP. The
+        # buffer is safe to refill each iteration: the .cpu() below waits for the copy out of it.
+        next_pixels = self._decode_pool.map(self._load_pixels, batches[0])
+        for i in tqdm(range(len(batches)), desc="Embedding images"):
+            decoded = list(next_pixels)
+            pixels = torch.stack(decoded, out=self._pixel_buffer[:len(decoded)])
+            if i + 1 < len(batches):
+                next_pixels = self._decode_pool.map(self._load_pixels, batches[i + 1])
             
-            all_embs.append(feats.cpu())
+            start = i * batch_size
+            out[start:start + len(pixels)] = self._embed_pixels(pixels).cpu().numpy()
         
-        return torch.cat(all_embs, dim=0).numpy().astype("float32")
+        return out
     
-    def embed_text(self, text: str) -> np.ndarray:
-        """Embed text query"""
-        inputs = self.processor(text=[text], return_tensors="pt").to(self.device)
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embed multiple texts, running CLIP only on the ones not cached yet, returns (N, D)"""
+        embeddings = [self._text_emb_cache.get(text) for text in texts]
+        misses = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        
+        if misses:
+            fresh = dict(zip(misses, self._text_batcher.encode(misses)))
+            for text, embedding in fresh.items():
+                self._text_emb_cache.put(text, embedding)
+            embeddings = [e if e is not None else fresh[t] for t, e in zip(texts, embeddings)]
         
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
-            feats = text_features.pooler_output if hasattr(text_features, 'pooler_output') else text_features
-            feats = feats / feats.norm(dim=-1, keepdim=True)
+        return np.stack(embeddings)
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Run the CLIP text encoder on a batch of texts in a single forward pass"""
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
+        
+        with inference_context(self.device, self.autocast):
+            feats = unit_features(self.model.get_text_features(**inputs))
         
         return feats.cpu().numpy().astype("float32")
     
+    def embed_text(self, text: str) -> np.ndarray:
+        """Embed text query"""
+        return self.embed_texts([text])
+    
     def embed_image(self, image: Image.Image) -> np.ndarray:
         """Embed a single image"""
-        inputs = self.processor(images=[image], return_tensors="pt").to(self.device)
-        
-        with torch.no_grad():
-            image_features = self.model.get_image_features(**inputs)
-            feats = image_features.pooler_output if hasattr(image_features, 'pooler_output') else image_features
-            feats = feats / feats.norm(dim=-1, keepdim=True)
-        
+        feats = self._embed_pixels(self._to_pixels(image).unsqueeze(0))
         return feats.cpu().numpy().astype("float32")[0]
-    
-    def batch_embed_texts(self, texts: List[str]) -> torch.Tensor:
-        """Batch embed multiple text queries (returns tensor for faster similarity computation)"""
-        all_embeddings = []
-        for text in texts:
-            embedding = self.embed_text(text)
-            all_embeddings.append(torch.tensor(embedding).to(self.device))
-        return torch.stack(all_embeddings)
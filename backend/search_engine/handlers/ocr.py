@@ -4,13 +4,13 @@ Supports both LLM-based OCR (preferred) and EasyOCR fallback
 """
 
 import os
-import base64
-import io
 import numpy as np
 import cv2
-from PIL import Image, ImageEnhance
+from PIL import Image
 from typing import Optional
 
+from ..utils.imaging import encode_image_base64
+
 try:
     import easyocr
     OCR_AVAILABLE = True
@@ -56,16 +56,9 @@ class OCRHandler:
         try:
             print("🤖 Using LLM vision for OCR...")
             
-            # Resize image to save tokens
+            # Resize image to save tokens (the LLM reads text fine at lower JPEG quality)
             MAX_SIZE = 360
-            img_copy = image.copy()
-            img_copy.thumbnail((MAX_SIZE, MAX_SIZE))
-            
-            # Convert to base64
-            buffer = io.BytesIO()
-            img_copy.save(buffer, format="JPEG", quality=85)
-            buffer.seek(0)
-            b64_image = base64.b64encode(buffer.read()).decode("utf-8")
+            b64_image = encode_image_base64(image, MAX_SIZE, quality=70)
             
             # Call OpenAI vision API
             model_name = os.getenv("OPENAI_MODEL", "gpt-4.1-nano")
@@ -146,15 +139,11 @@ class OCRHandler:
             cv2.THRESH_BINARY, 11, 2
         )
         
-        # Denoise
-        denoised = cv2.fastNlMeansDenoising(binary)
+        # Denoise (median blur removes speckle on a binary image at a fraction of NLM's cost)
+        denoised = cv2.medianBlur(binary, 3)
         
         # Increase contrast
-        pil_img = Image.fromarray(denoised)
-        enhancer = ImageEnhance.Contrast(pil_img)
-        enhanced = enhancer.enhance(2.0)
-        
-        return np.array(enhanced)
+        return cv2.convertScaleAbs(denoised, alpha=2.0, beta=0)
     
     def extract_text_with_easyocr(self, image: Image.Image) -> str:
         """Extract text using EasyOCR (fallback method)"""
@@ -178,32 +167,29 @@ class OCRHandler:
             print("📝 Preprocessing image for OCR...")
             processed_img = self.preprocess_image_for_ocr(image)
             
-            # Try OCR on original and processed images
-            all_results = []
-            
-            # Original image
-            print("📝 Running OCR on original image...")
-            results1 = self.ocr_reader.readtext(
-                np.array(image),
-                detail=1,
-                paragraph=False
-            )
-            all_results.extend(results1)
-            
-            # Processed image
+            # Processed image first - it reads handwriting on paper best
             print("📝 Running OCR on preprocessed image...")
-            results2 = self.ocr_reader.readtext(
+            all_results = self.ocr_reader.readtext(
                 processed_img,
                 detail=1,
                 paragraph=False
             )
-            all_results.extend(results2)
+            
+            # Only pay for a second pass on the original if nothing was read confidently
+            if max((conf for _, _, conf in all_results), default=0) < 0.5:
+                print("📝 Low confidence, running OCR on original image...")
+                all_results.extend(self.ocr_reader.readtext(
+                    np.array(image),
+                    detail=1,
+                    paragraph=False
+                ))
             
             print(f"📝 OCR found {len(all_results)} total text regions")
             
             # Deduplicate and filter results
             seen_texts = set()
             valid_texts = []
+            region_log = []
             
             for i, (bbox, text, conf) in enumerate(all_results):
                 text_lower = text.lower().strip()
@@ -212,7 +198,7 @@ class OCRHandler:
                 if text_lower in seen_texts:
                     continue
                 
-                print(f"📝 Region {i+1}: '{text}' (confidence: {conf:.2f})")
+                region_log.append(f"📝 Region {i+1}: '{text}' (confidence: {conf:.2f})")
                 
                 # Accept text with lower confidence for handwritten
                 if conf > 0.2:
@@ -223,13 +209,17 @@ class OCRHandler:
                         if alpha_count >= 2:
                             valid_texts.append(cleaned)
                             seen_texts.add(text_lower)
-                            print(f"✅ Accepted: '{cleaned}'")
+                            region_log.append(f"✅ Accepted: '{cleaned}'")
                         else:
-                            print(f"❌ Rejected (not enough letters): '{cleaned}'")
+                            region_log.append(f"❌ Rejected (not enough letters): '{cleaned}'")
                     else:
-                        print(f"❌ Rejected (too short): '{cleaned}'")
+                        region_log.append(f"❌ Rejected (too short): '{cleaned}'")
                 else:
-                    print(f"❌ Rejected (low confidence {conf:.2f}): '{text}'")
+                    region_log.append(f"❌ Rejected (low confidence {conf:.2f}): '{text}'")
+            
+            # One stdout write for the whole page instead of one per region
+            if region_log:
+                print("\n".join(region_log))
             
             extracted_text = " ".join(valid_texts)
             
@@ -0,0 +1,68 @@
+"""
+Text Batcher - Coalesces concurrent text-encode requests into one CLIP forward
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+
+class TextBatcher:
+    """Micro-batches text encodes submitted from concurrent request threads
+    
+    Each caller blocks until its texts are encoded. A background thread gathers the
+    requests that arrive within max_wait_ms of the first one (up to max_batch texts)
+    and encodes them all in a single call.
+    """
+    
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0
+    ):
+        self._encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="text-batcher", daemon=True)
+        self._worker.start()
+    
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts as part of the next batch, returns (N, D) like encode_fn"""
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+    
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            size = len(pending[0][0])
+            
+            # Keep collecting until the window closes or the batch is full
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while size < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+                    pending.append(item)
+                    size += len(item[0])
+            except queue.Empty:
+                pass
+            
+            texts = list(dict.fromkeys(t for batch, _ in pending for t in batch))
+            try:
+                row_of = {t: i for i, t in enumerate(texts)}
+                features = self._encode_fn(texts)
+                for batch, future in pending:
+                    future.set_result(features[[row_of[t] for t in batch]])
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
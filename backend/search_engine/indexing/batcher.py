@@ -0,0 +1,69 @@
+"""
+Search Batcher - Coalesces concurrent index searches into one FAISS call
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Hashable, Tuple
+
+import numpy as np
+
+
+class SearchBatcher:
+    """Micro-batches single-vector index searches submitted from concurrent request threads
+    
+    Each caller blocks until its search is done. A background thread gathers the
+    requests that arrive within max_wait_ms of the first one (up to max_batch), groups
+    them by their search options and runs each group as one multi-query search.
+    """
+    
+    def __init__(
+        self,
+        search_fn: Callable[[np.ndarray, Hashable], Tuple[np.ndarray, np.ndarray]],
+        max_batch: int = 64,
+        max_wait_ms: float = 2.0
+    ):
+        self._search_fn = search_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="search-batcher", daemon=True)
+        self._worker.start()
+    
+    def search(self, query: np.ndarray, options: Hashable) -> Tuple[np.ndarray, np.ndarray]:
+        """Search one (D,) query as part of the next batch, returns its (scores, ids) rows"""
+        future = Future()
+        self._queue.put((query, options, future))
+        return future.result()
+    
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            
+            # Keep collecting until the window closes or the batch is full
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while len(pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                pass
+            
+            # Only searches with identical options (k, filter, ef) can share one call
+            groups = {}
+            for item in pending:
+                groups.setdefault(item[1], []).append(item)
+            
+            for options, items in groups.items():
+                try:
+                    scores, ids = self._search_fn(np.stack([query for query, _, _ in items]), options)
+                    for row, (_, _, future) in enumerate(items):
+                        future.set_result((scores[row], ids[row]))
+                except Exception as e:
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
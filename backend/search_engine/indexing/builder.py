@@ -1,58 +1,224 @@
 """
-Index Builder - Builds vector database index from image embeddings
+Index Builder - Builds vector index from image embeddings
 """
 
-from qdrant_client import QdrantClient 
-from qdrant_client.models import VectorParams, Distance, PointStruct
+import hashlib
+import json
+import os
+import faiss
+import numpy as np
 
+# Switch from a brute-force scan to an HNSW graph once the corpus gets this large
+HNSW_THRESHOLD = 20_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 128
 
-async def build_index(engine):
-    """Build vector database index with Qdrant"""
-    # Try to load from cache first
-    engine.image_embeddings = engine.embedding_handler.load_embeddings_cache(engine.image_paths)
-    
-    if engine.image_embeddings is None:
-        print("Computing image embeddings...")
-        engine.image_embeddings = engine.embedding_handler.embed_images_batch(
-            engine.image_paths, batch_size=8
-        )
-        print(f"✅ Image embeddings: {engine.image_embeddings.shape}")
-        # Save to cache
-        engine.embedding_handler.save_embeddings_cache(
-            engine.image_embeddings, engine.image_paths
+# Images per CLIP forward while indexing; decode of the next batch overlaps each forward
+EMBED_BATCH_SIZE = 32
+
+# Vectors converted and added to the index per call, and rows used to train int8 ranges
+ADD_CHUNK_SIZE = 16_384
+TRAIN_SAMPLE_SIZE = 100_000
+
+# int8 ranges cover the central 98% of each dimension's values (0.99 quantiles), so a few
+# outliers don't stretch the range and waste code resolution; clipped values are rescored
+INT8_RANGE_QUANTILE = 0.01
+
+QUANTIZER_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def binary_codes(vectors: np.ndarray) -> np.ndarray:
+    """Pack the sign of every dimension into bits, (N, D) -> (N, D / 8) uint8"""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def _index_fingerprint(engine) -> str:
+    """Hash of everything a saved index depends on: the embedding rows (in id order) and index settings"""
+    embeddings = engine.image_embeddings
+    h = hashlib.blake2b(digest_size=16)
+    h.update(
+        f"{engine.index_quantization}:{INT8_RANGE_QUANTILE}:{HNSW_THRESHOLD}:{HNSW_M}:"
+        f"{HNSW_EF_CONSTRUCTION}:{embeddings.shape}".encode()
+    )
+    for start in range(0, len(embeddings), ADD_CHUNK_SIZE):
+        h.update(np.ascontiguousarray(embeddings[start:start + ADD_CHUNK_SIZE]).data)
+    return h.hexdigest()
+
+
+def _index_files(engine):
+    """Return the (index, metadata) file pair the index is persisted to"""
+    base = os.path.join(engine.embedding_handler.cache_dir, f"faiss_{engine.index_quantization}")
+    return f"{base}.index", f"{base}.json"
+
+
+def _load_index(engine, fingerprint: str):
+    """Read the persisted index if it was built from exactly these embeddings, else None"""
+    index_file, meta_file = _index_files(engine)
+    if not (os.path.exists(index_file) and os.path.exists(meta_file)):
+        return None
+    
+    try:
+        with open(meta_file, "r") as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                return None
+        if engine.index_quantization == "binary":
+            index = faiss.read_index_binary(index_file)
+        else:
+            index = faiss.read_index(index_file)
+        if index.ntotal != len(engine.image_embeddings):
+            return None
+        if isinstance(index, (faiss.IndexHNSW, faiss.IndexBinaryHNSW)):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+    except Exception as e:
+        print(f"⚠️  Error loading saved index: {e}, rebuilding...")
+        return None
+
+
+def _save_index(engine, fingerprint: str):
+    """Persist the index so an unchanged dataset skips the rebuild on the next start"""
+    index_file, meta_file = _index_files(engine)
+    try:
+        # Write-then-rename so a crash never leaves a truncated index behind
+        if engine.index_quantization == "binary":
+            faiss.write_index_binary(engine.index, f"{index_file}.tmp")
+        else:
+            faiss.write_index(engine.index, f"{index_file}.tmp")
+        with open(f"{meta_file}.tmp", "w") as f:
+            json.dump({"fingerprint": fingerprint, "ntotal": int(engine.index.ntotal)}, f)
+        os.replace(f"{index_file}.tmp", index_file)
+        os.replace(f"{meta_file}.tmp", meta_file)
+    except Exception as e:
+        print(f"⚠️  Error saving index: {e}")
+
+
+def _create_index(engine, embedding_size: int):
+    """Create an empty FAISS index sized for the corpus"""
+    if engine.index_quantization == "binary":
+        # One sign bit per dimension (1/32 of float32 memory), ranked by Hamming distance
+        # and rescored against the stored embeddings at search time
+        if len(engine.image_embeddings) < HNSW_THRESHOLD:
+            return faiss.IndexBinaryFlat(embedding_size)
+        index = faiss.IndexBinaryHNSW(embedding_size, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+    
+    # float16 codes score exactly; int8 codes take a quarter of the float32 memory and
+    # are rescored against the stored embeddings at search time
+    quantizer_type = QUANTIZER_TYPES[engine.index_quantization]
+    
+    if len(engine.image_embeddings) < HNSW_THRESHOLD:
+        # Flat inner-product scan over scalar-quantized vectors
+        index = faiss.IndexScalarQuantizer(
+            embedding_size, quantizer_type, faiss.METRIC_INNER_PRODUCT
         )
+        sq_index = index
     else:
-        print(f"✅ Image embeddings: {engine.image_embeddings.shape}")
+        # Large corpus: HNSW graph over the same scalar-quantized storage
+        index = faiss.IndexHNSWSQ(
+            embedding_size, quantizer_type, HNSW_M, faiss.METRIC_INNER_PRODUCT
+        )
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        sq_index = faiss.downcast_index(index.storage)
     
-    # Initialize Qdrant
-    engine.client = QdrantClient(":memory:")
+    if engine.index_quantization == "int8":
+        sq_index.sq.rangestat = faiss.ScalarQuantizer.RS_quantiles
+        sq_index.sq.rangestat_arg = INT8_RANGE_QUANTILE
+    return index
+
+
+def _plain_scores(engine):
+    """Score every image against each category's plain-jewelry terms, returns {category: (N,)}"""
+    embeddings = engine.image_embeddings
+    scores = {}
+    for category in engine.categories:
+        terms = engine.embedding_handler.embed_texts(engine.query_processor.get_plain_terms(category))
+        category_scores = np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), ADD_CHUNK_SIZE):
+            chunk = embeddings[start:start + ADD_CHUNK_SIZE].astype(np.float32)
+            category_scores[start:start + len(chunk)] = (chunk @ terms.T).max(axis=1)
+        scores[category] = category_scores
+    return scores
+
+
+async def build_index(engine):
+    """Build FAISS inner-product index over the normalized image embeddings"""
+    # Reuse cached embeddings, only new or modified images go through CLIP
+    engine.image_embeddings = engine.embedding_handler.embed_images_cached(
+        engine.image_paths, batch_size=EMBED_BATCH_SIZE
+    )
+    print(f"✅ Image embeddings: {engine.image_embeddings.shape}")
     
     # Determine embedding size (768 for CLIP-ViT-L)
     embedding_size = engine.image_embeddings.shape[1] if len(engine.image_embeddings) > 0 else 768
     
-    engine.client.create_collection(
-        collection_name=engine.collection_name,
-        vectors_config=VectorParams(
-            size=embedding_size,
-            distance=Distance.COSINE
-        )
-    )
-    
     if len(engine.image_embeddings) > 0:
-        # Index all images
-        points = [
-            PointStruct(
-                id=i,
-                vector=engine.image_embeddings[i].tolist(),
-                payload={
-                    "image_path": engine.image_paths[i],
-                    "category": engine.image_categories[i]
-                }
-            )
-            for i in range(len(engine.image_embeddings))
-        ]
+        embeddings = engine.image_embeddings
         
-        engine.client.upsert(collection_name=engine.collection_name, points=points)
-        print(f"✅ Indexed {len(points)} images in Qdrant")
+        # An unchanged dataset reuses the index saved by the previous run
+        fingerprint = _index_fingerprint(engine)
+        engine.index = _load_index(engine, fingerprint)
+        if engine.index is not None:
+            print(f"✅ Loaded saved FAISS index with {engine.index.ntotal} images")
+        else:
+            engine.index = _create_index(engine, embedding_size)
+            
+            # int8 learns per-dimension ranges from a sample; float16 needs no training
+            if not engine.index.is_trained:
+                sample = embeddings
+                if len(embeddings) > TRAIN_SAMPLE_SIZE:
+                    rng = np.random.default_rng(0)
+                    sample = embeddings[np.sort(rng.choice(len(embeddings), TRAIN_SAMPLE_SIZE, replace=False))]
+                engine.index.train(np.ascontiguousarray(sample, dtype=np.float32))
+            
+            # Add in chunks: only one chunk of the float16 (possibly memory-mapped) matrix is
+            # ever widened to float32, instead of a full-size copy
+            for start in range(0, len(embeddings), ADD_CHUNK_SIZE):
+                vectors = np.ascontiguousarray(embeddings[start:start + ADD_CHUNK_SIZE], dtype=np.float32)
+                
+                # Search scores vectors as cosine without re-normalizing, so check the invariant here
+                assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-3), \
+                    "Image embeddings must be L2-normalized"
+                engine.index.add(binary_codes(vectors) if engine.index_quantization == "binary" else vectors)
+            print(f"✅ Indexed {engine.index.ntotal} images in FAISS")
+            
+            _save_index(engine, fingerprint)
     else:
+        engine.index = _create_index(engine, embedding_size)
         print("⚠️  No images to index - database is empty")
+    
+    # Filtered binary searches scan these codes directly, since binary indexes take no id selector
+    engine.binary_codes = None
+    if engine.index_quantization == "binary" and len(engine.image_embeddings) > 0:
+        engine.binary_codes = np.concatenate([
+            binary_codes(engine.image_embeddings[start:start + ADD_CHUNK_SIZE])
+            for start in range(0, len(engine.image_embeddings), ADD_CHUNK_SIZE)
+        ])
+    
+    # Max cosine of every image against each category's fixed plain terms, used by the
+    # negation filter instead of a per-query matmul
+    engine.plain_scores = _plain_scores(engine)
+    
+    # Cached query hits refer to the previous index
+    engine.query_cache.clear()
+    
+    # Prebuild one boolean mask (for post-filtering candidates) and one id selector
+    # (for filtered index searches) per category
+    engine.category_masks = {}
+    engine.category_selectors = {}
+    for category_id, category in enumerate(engine.categories):
+        mask = engine.image_category_ids == category_id
+        engine.category_masks[category] = mask
+        category_ids = np.flatnonzero(mask)
+        if len(category_ids) > 0:
+            engine.category_selectors[category] = faiss.IDSelectorBatch(category_ids)
+    
+    # Image categories only change on (re)indexing, so count them once here
+    counts = np.bincount(engine.image_category_ids, minlength=len(engine.categories))
+    engine.category_counts = dict(zip(engine.categories, counts.tolist()))
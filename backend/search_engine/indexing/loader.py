@@ -2,7 +2,28 @@
 Image Loader - Loads jewelry images from dataset directories
 """
 
+import asyncio
 import os
+import numpy as np
+from typing import List
+
+IMAGE_EXTENSIONS = frozenset({"jpg", "jpeg", "png"})
+
+
+def _is_image_name(name: str) -> bool:
+    """Check the extension after the last dot against IMAGE_EXTENSIONS"""
+    dot = name.rfind(".")
+    return dot >= 0 and name[dot + 1:].lower() in IMAGE_EXTENSIONS
+
+
+def _list_category(cat_dir: str) -> List[str]:
+    """List image files in one category directory, sorted (scandir reuses the cached d_type)"""
+    with os.scandir(cat_dir) as it:
+        paths = [e.path for e in it if _is_image_name(e.name) and e.is_file()]
+    
+    # scandir order depends on the filesystem; sorting keeps image ids stable across runs
+    paths.sort()
+    return paths
 
 
 async def load_images(engine):
@@ -14,21 +35,30 @@ async def load_images(engine):
         print(f"ℹ️  Please create the directory and add your jewelry images")
         print(f"ℹ️  Expected structure: {image_dir}/{{category}}/{{image.jpg}}")
     
-    for category in engine.categories:
+    categories = []
+    for category_id, category in enumerate(engine.categories):
         cat_dir = os.path.join(image_dir, category)
         if not os.path.isdir(cat_dir):
             print(f"⚠️  Category directory not found: {cat_dir}")
             continue
-        
-        count_before = len(engine.image_paths)
-        for f in os.listdir(cat_dir):
-            if f.lower().endswith((".jpg", ".jpeg", ".png")):
-                engine.image_paths.append(os.path.join(cat_dir, f))
-                engine.image_categories.append(category)
-        
-        images_added = len(engine.image_paths) - count_before
-        if images_added > 0:
-            print(f"✅ Loaded {images_added} {category} images")
+        categories.append((category_id, category, cat_dir))
+    
+    # List every category directory concurrently (they may live on different disks),
+    # then concatenate in category order
+    listings = await asyncio.gather(
+        *(asyncio.to_thread(_list_category, cat_dir) for _, _, cat_dir in categories)
+    )
+    
+    for (_, category, _), paths in zip(categories, listings):
+        if paths:
+            print(f"✅ Loaded {len(paths)} {category} images")
+    
+    # Store as columns: one object array of paths, one uint8 category id per image
+    engine.image_paths = np.array([p for paths in listings for p in paths], dtype=object)
+    engine.image_category_ids = np.repeat(
+        np.array([category_id for category_id, _, _ in categories], dtype=np.uint8),
+        [len(paths) for paths in listings]
+    )
     
     engine.total_images = len(engine.image_paths)
     print(f"✅ Total: {engine.total_images} images across {len(engine.categories)} categories")
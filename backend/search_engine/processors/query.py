@@ -3,14 +3,39 @@ Query Processor for Search Query Enhancement and Filtering
 Handles negations, category extraction, and decoration filtering
 """
 
+import re
 from typing import List
 
+from ..utils.cache import LRUCache
+
 
 class QueryProcessor:
     """Processes search queries for enhanced semantic search"""
     
+    # Patterns: "no X" and "without X"
+    _NEG_RE = re.compile(r"\b(?:no|without)\s+(\w+)")
+    
+    # Negated words users type most, whose decoration terms are embedded at startup
+    COMMON_NEGATIONS = ["diamond", "stone", "gem", "pendant", "charm", "pattern", "design", "engraving"]
+    
+    # Variations of every negated term with the category ({c} = category, {n} = negated term)
+    DECORATION_TEMPLATES = (
+        "{c} with {n}", "{n} {c}", "{c} featuring {n}", "{n}s on {c}", "{c} set with {n}s"
+    )
+    
+    # Extra variations for negated terms containing any of the keywords
+    DECORATION_GROUPS = (
+        (("diamond", "stone", "gem"), ("jeweled {c}", "sparkly {c}", "{c} with stones", "{c} with gems")),
+        (("pendant", "charm"), ("{c} with pendant", "{c} with charm", "pendant {c}", "charm {c}")),
+        (("pattern", "design", "engraving"), ("patterned {c}", "engraved {c}", "ornate {c}", "{c} with design")),
+    )
+    
     def __init__(self, categories: List[str]):
         self.categories = categories
+        self._category_set = frozenset(categories)
+        
+        # Decoration terms per (category, negations), repeat negation queries skip the string work
+        self._decoration_cache = LRUCache(maxsize=1024)
     
     def extract_categories(self, query: str) -> List[str]:
         """Extract categories from query"""
@@ -20,59 +45,31 @@ class QueryProcessor:
     
     def extract_negations(self, query: str) -> List[str]:
         """Extract negation terms from query"""
-        q = query.lower()
-        negations = []
-        
-        # Pattern: "no X"
-        words = q.split()
-        for i, word in enumerate(words):
-            if word == "no" and i + 1 < len(words):
-                next_word = words[i + 1]
-                if next_word not in self.categories:
-                    negations.append(next_word)
-        
-        # Pattern: "without X"
-        if "without" in q:
-            parts = q.split("without")
-            if len(parts) > 1:
-                after_without = parts[1].strip().split()
-                if after_without and after_without[0] not in self.categories:
-                    negations.append(after_without[0])
-        
-        return list(set(negations))
+        negations = (match.group(1) for match in self._NEG_RE.finditer(query.lower()))
+        return list(dict.fromkeys(term for term in negations if term not in self._category_set))
     
     def get_decoration_terms(self, category: str, negations: List[str]) -> List[str]:
         """Generate decoration detection terms based on what was negated"""
-        decoration_terms = []
+        key = (category, tuple(negations))
+        cached = self._decoration_cache.get(key)
+        if cached is not None:
+            return list(cached)
         
+        # Keys of an insertion-ordered dict: deduplicated, in first-seen order
+        decoration_terms = {}
         for neg in negations:
-            # Add variations of the negated term with the category
-            decoration_terms.extend([
-                f"{category} with {neg}",
-                f"{neg} {category}",
-                f"{category} featuring {neg}",
-                f"{neg}s on {category}",
-                f"{category} set with {neg}s"
-            ])
+            templates = list(self.DECORATION_TEMPLATES)
             
             # Add specific variations based on common jewelry terms
-            if "diamond" in neg or "stone" in neg or "gem" in neg:
-                decoration_terms.extend([
-                    f"jeweled {category}", f"sparkly {category}",
-                    f"{category} with stones", f"{category} with gems"
-                ])
-            if "pendant" in neg or "charm" in neg:
-                decoration_terms.extend([
-                    f"{category} with pendant", f"{category} with charm",
-                    f"pendant {category}", f"charm {category}"
-                ])
-            if "pattern" in neg or "design" in neg or "engraving" in neg:
-                decoration_terms.extend([
-                    f"patterned {category}", f"engraved {category}",
-                    f"ornate {category}", f"{category} with design"
-                ])
+            for keywords, extra in self.DECORATION_GROUPS:
+                if any(keyword in neg for keyword in keywords):
+                    templates.extend(extra)
+            
+            for template in templates:
+                decoration_terms[template.format(c=category, n=neg)] = None
         
-        return list(set(decoration_terms))
+        self._decoration_cache.put(key, tuple(decoration_terms))
+        return list(decoration_terms)
     
     def get_plain_terms(self, category: str) -> List[str]:
         """Generate plain/simple detection terms"""
@@ -2,8 +2,11 @@
 Recommendations Module - Product Recommendation Features
 """
 
+import asyncio
 from typing import Dict, Any
 
+from .search import _format_hits
+
 
 async def recommend(engine, image_id: int, top_k: int = 5) -> Dict[str, Any]:
     """Get recommendations based on image similarity"""
@@ -13,30 +16,20 @@ async def recommend(engine, image_id: int, top_k: int = 5) -> Dict[str, Any]:
     # Get image embedding
     img_embedding = engine.image_embeddings[image_id]
     
-    # Search similar images
-    results = engine.client.search(
-        collection_name=engine.collection_name,
-        query_vector=img_embedding.tolist(),
+    # Search similar images (on a worker thread: search_index blocks on the search batcher)
+    results = await asyncio.to_thread(
+        engine.search_index,
+        img_embedding,
         limit=top_k + 1  # +1 to exclude the query image itself
     )
     
     # Format results (exclude the query image)
-    formatted_results = []
-    for p in results:
-        if p.id != image_id:
-            formatted_results.append({
-                "id": p.id,
-                "image_path": p.payload["image_path"],
-                "category": p.payload["category"],
-                "similarity_score": float(p.score),
-                "plain_score": None,
-                "decoration_score": None
-            })
+    formatted_results = _format_hits(engine, [(i, score) for i, score in results if i != image_id][:top_k])
     
     return {
         "query": f"Similar to image {image_id}",
-        "enhanced_query": f"Recommendations for {engine.image_categories[image_id]}",
-        "categories": [engine.image_categories[image_id]],
+        "enhanced_query": f"Recommendations for {engine.image_category(image_id)}",
+        "categories": [engine.image_category(image_id)],
         "negations": [],
         "results": formatted_results[:top_k],
         "total_results": len(formatted_results[:top_k]),
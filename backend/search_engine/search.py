@@ -2,24 +2,64 @@
 Search Module - All Search Functionality
 """
 
-import torch
+import asyncio
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from typing import Optional, List, Dict, Any
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from typing import Optional, List, Dict, Any, Tuple
 
+from .utils.imaging import image_digest
 
-async def search(
+# Embeds negation terms while the calling thread runs the index search
+_term_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="term-embed")
+
+
+def _format_hits(
+    engine,
+    hits: List[Tuple[int, float]],
+    plain_scores: Optional[List[float]] = None,
+    decoration_scores: Optional[List[float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Project (image_id, score) index hits straight into response results, optionally with
+    the negation filter's per-hit plain and decoration scores
+    """
+    if not hits:
+        return []
+    ids, scores = zip(*hits)
+    ids = list(ids)
+    if plain_scores is None:
+        plain_scores = decoration_scores = [None] * len(ids)
+    categories = engine.categories
+    return [
+        {
+            "id": i,
+            "image_path": path,
+            "category": categories[category_id],
+            "similarity_score": score,
+            "plain_score": plain_score,
+            "decoration_score": decoration_score
+        }
+        for i, score, path, category_id, plain_score, decoration_score in zip(
+            ids, scores, engine.image_paths[ids], engine.image_category_ids[ids].tolist(),
+            plain_scores, decoration_scores
+        )
+    ]
+
+
+def _search(
     engine,
     query: str,
     categories: Optional[List[str]] = None,
     top_k: int = 5,
     max_decoration_score: float = 0.25,
     min_plain_score: float = 0.28,
-    semantic_top_k: int = 100
+    semantic_top_k: int = 100,
+    ef_search: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Perform semantic search with negation filtering
+    (ef_search tunes HNSW recall vs. speed on large indexes)
     """
     # Extract query components using query processor
     filter_categories = categories or engine.query_processor.extract_categories(query)
@@ -32,75 +72,75 @@ async def search(
     # Embed query using embedding handler
     query_embedding = engine.embedding_handler.embed_text(enhanced_query)
     
-    # Pre-compute decoration and plain term embeddings if we have negations
-    decoration_embeddings = None
-    plain_embeddings = None
+    # Start the decoration and plain term embeddings if we have negations; the CLIP
+    # forward runs on another thread while stage 1 searches the index
+    decoration_future = None
+    plain_future = None
     if negations:
         decoration_terms = engine.query_processor.get_decoration_terms(category, negations)
-        plain_terms = engine.query_processor.get_plain_terms(category)
         
         # Batch embed all terms at once (much faster than one by one)
-        decoration_embeddings = engine.embedding_handler.batch_embed_texts(decoration_terms)
-        plain_embeddings = engine.embedding_handler.batch_embed_texts(plain_terms)
+        decoration_future = _term_executor.submit(engine.embedding_handler.embed_texts, decoration_terms)
+        # Plain terms only depend on the category, so known categories were scored at index time
+        if category not in engine.plain_scores:
+            plain_terms = engine.query_processor.get_plain_terms(category)
+            plain_future = _term_executor.submit(engine.embedding_handler.embed_texts, plain_terms)
     
-    # Stage 1: Semantic search
-    semantic_results = engine.client.search(
-        collection_name=engine.collection_name,
-        query_vector=query_embedding[0].tolist(),
-        limit=semantic_top_k,
-        with_vectors=True
-    )
-    
-    semantic_points = semantic_results
+    # Stage 1 + 2: Semantic search restricted to the wanted categories inside the index,
+    # so all semantic_top_k candidates are in-category (near-duplicate queries reuse cached hits).
+    # A filter covering every category matches all ids, so it runs as the faster unfiltered search
+    search_categories = None
+    if filter_categories and not set(filter_categories) >= set(engine.categories):
+        search_categories = tuple(filter_categories)
+    search_params = (semantic_top_k, ef_search, search_categories)
+    cached = engine.query_cache.lookup(query_embedding[0])
+    if cached is not None and cached[0] == search_params:
+        # Only the candidate ids are reused; scores and order come from this query
+        ids = [i for i, _ in cached[1]]
+        scores = engine.image_embeddings[ids].astype(np.float32) @ query_embedding[0]
+        order = np.argsort(-scores, kind="stable")
+        hits = [(ids[j], float(scores[j])) for j in order]
+    else:
+        hits = engine.search_index(
+            query_embedding[0], semantic_top_k, ef_search=ef_search,
+            categories=list(search_categories) if search_categories else None
+        )
+        engine.query_cache.insert(query_embedding[0], (search_params, hits))
     filter_stats = {
-        "semantic_matches": len(semantic_points),
-        "category_filtered": 0,
+        "semantic_matches": len(hits),
+        "category_filtered": len(hits) if filter_categories else 0,
         "negation_filtered": 0,
         "final_results": 0
     }
     
-    # Stage 2: Category filter
-    filtered_points = semantic_points
-    if filter_categories:
-        filtered_points = [p for p in filtered_points if p.payload["category"] in filter_categories]
-        filter_stats["category_filtered"] = len(filtered_points)
+    decoration_embeddings = decoration_future.result() if decoration_future is not None else None
+    plain_embeddings = plain_future.result() if plain_future is not None else None
     
-    # Stage 3: Negation + decoration filter
-    if negations and decoration_embeddings is not None and plain_embeddings is not None:
-        passed_images = []
-        
-        for p in filtered_points:
-            img_emb = torch.tensor(p.vector).unsqueeze(0).to(engine.device)
-            img_emb = img_emb / img_emb.norm(dim=-1, keepdim=True)
+    # Stage 3: Negation + decoration filter (candidates stay as (id, score) pairs and
+    # only the top_k survivors are turned into result dicts)
+    plain_scores = None
+    decoration_scores = None
+    if negations and decoration_embeddings is not None:
+        if hits:
+            # Stored embeddings are unit-norm, so one matmul per term set gives every cosine score
+            ids = [i for i, _ in hits]
+            img_mat = engine.image_embeddings[ids].astype(np.float32)
+            max_decoration = (decoration_embeddings @ img_mat.T).max(axis=0)
+            if plain_embeddings is None:
+                max_plain = engine.plain_scores[category][ids]
+            else:
+                max_plain = (plain_embeddings @ img_mat.T).max(axis=0)
             
-            # Batch compute decoration similarity
-            decoration_scores = (decoration_embeddings @ img_emb.T).squeeze()
-            max_decoration = decoration_scores.max().item()
-            
-            # Batch compute plain similarity
-            plain_scores = (plain_embeddings @ img_emb.T).squeeze()
-            max_plain = plain_scores.max().item()
-            
-            if max_decoration < max_decoration_score and max_plain > min_plain_score:
-                passed_images.append((p, max_plain, max_decoration))
+            passed = np.flatnonzero((max_decoration < max_decoration_score) & (max_plain > min_plain_score))
+            passed = passed[np.argsort(-max_plain[passed], kind="stable")]
+            hits = [hits[j] for j in passed]
+            plain_scores = max_plain[passed[:top_k]].tolist()
+            decoration_scores = max_decoration[passed[:top_k]].tolist()
         
-        passed_images = sorted(passed_images, key=lambda x: x[1], reverse=True)
-        filtered_points = [(p, plain, deco) for p, plain, deco in passed_images]
-        filter_stats["negation_filtered"] = len(filtered_points)
-    else:
-        filtered_points = [(p, None, None) for p in filtered_points]
+        filter_stats["negation_filtered"] = len(hits)
     
     # Format results
-    results = []
-    for i, (p, plain_score, decoration_score) in enumerate(filtered_points[:top_k]):
-        results.append({
-            "id": p.id,
-            "image_path": p.payload["image_path"],
-            "category": p.payload["category"],
-            "similarity_score": float(p.score),
-            "plain_score": float(plain_score) if plain_score is not None else None,
-            "decoration_score": float(decoration_score) if decoration_score is not None else None
-        })
+    results = _format_hits(engine, hits[:top_k], plain_scores, decoration_scores)
     
     filter_stats["final_results"] = len(results)
     
@@ -115,23 +155,22 @@ async def search(
     }
 
 
-async def search_by_image(engine, image: Image.Image, top_k: int = 10) -> Dict[str, Any]:
-    """Search by uploaded image with automatic text extraction and type detection"""
-    # First, try to extract text using LLM
-    extracted_text = engine.jewelry_utils.extract_text_with_llm(image)
-    
-    # Detect jewelry type using jewelry utils
-    detected_type = engine.jewelry_utils.detect_jewelry_type(image)
+def _search_by_image(
+    engine, image: Image.Image, top_k: int, extracted_text: Optional[str], img_embedding: np.ndarray
+) -> Dict[str, Any]:
+    """Route an uploaded image to hybrid, text or image search given its extracted text and embedding"""
+    # The same image vector drives type detection and the search
+    detected_type = engine.jewelry_utils.detect_jewelry_type_from_features(img_embedding)
     
     # If we have both text AND detected jewelry, use hybrid search
     if extracted_text and detected_type:
         print(f"🔍 Text + Jewelry detected - Hybrid search: '{extracted_text}' + {detected_type} image")
-        return await search_by_image_and_text(engine, image, extracted_text, top_k, detected_type)
+        return _search_by_image_and_text(engine, image, extracted_text, top_k, detected_type, img_embedding)
     
     # If we have extracted text only, search by text
     if extracted_text:
         print(f"🔍 Text detected - Searching by text: '{extracted_text}'")
-        return await search(
+        return _search(
             engine=engine,
             query=extracted_text,
             categories=None,  # Let it extract from text
@@ -144,65 +183,50 @@ async def search_by_image(engine, image: Image.Image, top_k: int = 10) -> Dict[s
     # Otherwise, if jewelry (ring/necklace) is detected, search by image
     print(f"🔍 No text detected - Searching by image{f' (detected: {detected_type})' if detected_type else ''}")
     
-    # Embed the uploaded image
-    img_embedding = engine.embedding_handler.embed_image(image)
-    
-    # Filter by detected type if available
-    search_filter = None
-    if detected_type:
-        search_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="category",
-                    match=MatchValue(value=detected_type)
-                )
-            ]
-        )
-    
-    # Search
-    results = engine.client.search(
-        collection_name=engine.collection_name,
-        query_vector=img_embedding.tolist(),
-        limit=top_k,
-        query_filter=search_filter
-    )
-    
-    # Format results
-    formatted_results = []
-    for p in results:
-        formatted_results.append({
-            "id": p.id,
-            "image_path": p.payload["image_path"],
-            "category": p.payload["category"],
-            "similarity_score": float(p.score),
-            "plain_score": None,
-            "decoration_score": None
-        })
+    # Search, filtered by detected type if available
+    hits = engine.search_index(img_embedding, top_k, category=detected_type)
+    formatted_results = _format_hits(engine, hits)
     
     return {
         "query": "Image search",
         "enhanced_query": f"Image-based search{f' (filtered to: {detected_type})' if detected_type else ''}", 
-        "categories": [detected_type] if detected_type else list(set([r["category"] for r in formatted_results])),
+        "categories": [detected_type] if detected_type else list(dict.fromkeys(r["category"] for r in formatted_results)),
         "negations": [],
         "results": formatted_results,
         "total_results": len(formatted_results),
-        "filter_stats": {"semantic_matches": len(results), "category_filter": detected_type if detected_type else "none"}
+        "filter_stats": {"semantic_matches": len(hits), "category_filter": detected_type if detected_type else "none"}
     }
 
 
-async def search_by_image_and_text(
-    engine, image: Image.Image, query: str, top_k: int = 10, detected_type: Optional[str] = None
+def _search_by_image_and_text(
+    engine,
+    image: Image.Image,
+    query: str,
+    top_k: int = 10,
+    detected_type: Optional[str] = None,
+    img_embedding: Optional[np.ndarray] = None,
+    image_weight: float = 0.6
 ) -> Dict[str, Any]:
-    """Search by combining image and text embeddings"""
-    # Embed the uploaded image using embedding handler
-    img_embedding = engine.embedding_handler.embed_image(image)
+    """
+    Search by combining image and text embeddings (img_embedding skips re-embedding the image).
+    image_weight sets the image's share of the blend, the text gets the rest.
+    """
+    # Embed the uploaded image using embedding handler (combined in place below, so copy)
+    if img_embedding is None:
+        img_embedding = engine.embedding_handler.embed_image(image)
+    else:
+        img_embedding = img_embedding.copy()
     
     # Embed the text query using embedding handler
     text_embedding = engine.embedding_handler.embed_text(query)
     
-    # Combine embeddings (weighted average: 0.6 image + 0.4 text)
-    combined_embedding = 0.6 * img_embedding + 0.4 * text_embedding[0]
-    combined_embedding = combined_embedding / np.linalg.norm(combined_embedding)
+    # Combine embeddings (weighted average, 0.6 image + 0.4 text by default), in place on
+    # the fresh image vector so no intermediates are allocated. A blend of two unit vectors
+    # is shorter than unit length, so it is renormalized for cosine scoring
+    combined_embedding = img_embedding
+    combined_embedding *= image_weight
+    combined_embedding += (1.0 - image_weight) * text_embedding[0]
+    combined_embedding /= np.sqrt(combined_embedding @ combined_embedding)
     
     # Extract categories from query text OR use detected type
     filter_categories = engine.query_processor.extract_categories(query)
@@ -215,44 +239,92 @@ async def search_by_image_and_text(
         filter_categories = [detected_type]
     
     # Build category filter
-    search_filter = None
-    if filter_categories and len(filter_categories) < len(engine.categories):
+    search_category = None
+    if filter_categories and not set(filter_categories) >= set(engine.categories):
         # Only filter if we have specific categories (not all categories)
-        search_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="category",
-                    match=MatchValue(value=filter_categories[0])  # Use first/main category
-                )
-            ]
-        )
+        search_category = filter_categories[0]  # Use first/main category
     
     # Search with category filter
-    results = engine.client.search(
-        collection_name=engine.collection_name,
-        query_vector=combined_embedding.tolist(),
-        limit=top_k,
-        query_filter=search_filter
-    )
-    
-    # Format results
-    formatted_results = []
-    for p in results:
-        formatted_results.append({
-            "id": p.id,
-            "image_path": p.payload["image_path"],
-            "category": p.payload["category"],
-            "similarity_score": float(p.score),
-            "plain_score": None,
-            "decoration_score": None
-        })
+    hits = engine.search_index(combined_embedding, top_k, category=search_category)
+    formatted_results = _format_hits(engine, hits)
     
     return {
         "query": query,
         "enhanced_query": f"Image + Text: {query}{f' (filtered to: {filter_categories[0]})' if filter_categories and len(filter_categories) < len(engine.categories) else ''}",
-        "categories": filter_categories if filter_categories else list(set([r["category"] for r in formatted_results])),
+        "categories": filter_categories if filter_categories else list(dict.fromkeys(r["category"] for r in formatted_results)),
         "negations": [],
         "results": formatted_results,
         "total_results": len(formatted_results),
-        "filter_stats": {"semantic_matches": len(results), "category_filter": filter_categories[0] if filter_categories and len(filter_categories) < len(engine.categories) else "none"}
+        "filter_stats": {"semantic_matches": len(hits), "category_filter": filter_categories[0] if filter_categories and len(filter_categories) < len(engine.categories) else "none"}
     }
+
+
+# CLIP forwards, OCR/LLM calls and FAISS searches all block, so the endpoints run
+# them on a worker thread and keep the event loop free for other requests
+
+async def search(
+    engine,
+    query: str,
+    categories: Optional[List[str]] = None,
+    top_k: int = 5,
+    max_decoration_score: float = 0.25,
+    min_plain_score: float = 0.28,
+    semantic_top_k: int = 100,
+    ef_search: Optional[int] = None
+) -> Dict[str, Any]:
+    """Perform semantic search with negation filtering"""
+    return await asyncio.to_thread(
+        _search, engine, query, categories, top_k,
+        max_decoration_score, min_plain_score, semantic_top_k, ef_search
+    )
+
+
+def _extract_text_cached(engine, key: str, image: Image.Image) -> Optional[str]:
+    """LLM text extraction memoized on disk by image content hash"""
+    extracted_text = engine.llm_text_cache.get(key)
+    if extracted_text is not None:
+        return extracted_text
+    
+    # "" (no text) is a real answer and is persisted; None means a failed or unavailable
+    # call, so it is retried rather than persisted
+    extracted_text = engine.jewelry_utils.extract_text_with_llm(image)
+    if extracted_text is not None:
+        engine.llm_text_cache.put(key, extracted_text)
+    return extracted_text
+
+
+async def search_by_image(engine, image: Image.Image, top_k: int = 10) -> Dict[str, Any]:
+    """Search by uploaded image with automatic text extraction and type detection"""
+    # Upright the photo (EXIF + sideways heuristic) before it is embedded, so type
+    # detection and the image search both see the corrected orientation
+    image = await asyncio.to_thread(engine.jewelry_utils.correct_image_rotation, image)
+    
+    # Re-uploads of the same photo skip the CLIP forward; the text goes through the LLM text
+    # cache, which keeps answers but not failures, so a failed call is retried next time
+    key = await asyncio.to_thread(image_digest, image)
+    img_embedding = engine.upload_cache.get(key)
+    if img_embedding is not None:
+        extracted_text = await asyncio.to_thread(_extract_text_cached, engine, key, image)
+    else:
+        # The LLM text extraction is a network round trip and the embedding a CLIP forward;
+        # neither depends on the other, so overlap them
+        extracted_text, img_embedding = await asyncio.gather(
+            asyncio.to_thread(_extract_text_cached, engine, key, image),
+            asyncio.to_thread(engine.embedding_handler.embed_image, image)
+        )
+        engine.upload_cache.put(key, img_embedding)
+    return await asyncio.to_thread(_search_by_image, engine, image, top_k, extracted_text, img_embedding)
+
+
+async def search_by_image_and_text(
+    engine,
+    image: Image.Image,
+    query: str,
+    top_k: int = 10,
+    detected_type: Optional[str] = None,
+    image_weight: float = 0.6
+) -> Dict[str, Any]:
+    """Search by combining image and text embeddings"""
+    return await asyncio.to_thread(
+        _search_by_image_and_text, engine, image, query, top_k, detected_type, None, image_weight
+    )
@@ -3,5 +3,6 @@ Utility modules for jewelry operations
 """
 
 from .jewelry import JewelryUtils
+from .cache import DiskCache, LRUCache, SemanticQueryCache
 
-__all__ = ['JewelryUtils']
+__all__ = ['JewelryUtils', 'DiskCache', 'LRUCache', 'SemanticQueryCache']
@@ -0,0 +1,143 @@
+"""
+Small thread-safe caches used to memoize embeddings, model outputs and search results
+"""
+
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used entry when full"""
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key (marking it recently used) or None"""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def put(self, key: Hashable, value: Any):
+        """Store value under key, evicting the oldest entry if the cache is full"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache:
+    """String-valued cache persisted to a SQLite file, fronted by an in-memory LRU
+    
+    Entries survive restarts, for results that are slow or costly to recompute
+    (remote API calls). Values are never evicted from disk.
+    """
+    
+    def __init__(self, path: str, maxsize: int = 512):
+        self._memory = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    
+    def get(self, key: str) -> Optional[str]:
+        """Return the value for key from memory or disk, or None (also when the disk read fails)"""
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            # e.g. "database is locked" with several workers sharing the file: treat as a miss
+            print(f"⚠️  Disk cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        self._memory.put(key, row[0])
+        return row[0]
+    
+    def put(self, key: str, value: str):
+        """Store value under key in memory and on disk (a failed disk write keeps the memory entry)"""
+        self._memory.put(key, value)
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+        except sqlite3.Error as e:
+            print(f"⚠️  Disk cache write failed: {e}")
+
+
+class SemanticQueryCache:
+    """Bounded LRU cache keyed by L2-normalized query embeddings
+    
+    A lookup hits when some stored key has cosine similarity >= threshold with the
+    query, so near-duplicate queries share one cached result.
+    """
+    
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._keys = None  # (maxsize, D) float32, allocated on first insert
+        self._values = OrderedDict()  # slot -> value, least recently used first
+        self._lock = threading.Lock()
+    
+    def lookup(self, embedding: np.ndarray) -> Optional[Any]:
+        """Return the value of the most similar stored query above the threshold, or None"""
+        with self._lock:
+            if self._values:
+                slots = np.fromiter(self._values, dtype=np.int64, count=len(self._values))
+                similarities = self._keys[slots] @ np.asarray(embedding, dtype=np.float32).reshape(-1)
+                best = int(similarities.argmax())
+                if similarities[best] >= self.threshold:
+                    slot = int(slots[best])
+                    self._values.move_to_end(slot)
+                    self.hits += 1
+                    return self._values[slot]
+            self.misses += 1
+            return None
+    
+    def insert(self, embedding: np.ndarray, value: Any):
+        """Store value under embedding, reusing the least recently used slot if full"""
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._keys is None or self._keys.shape[1] != embedding.shape[0]:
+                self._keys = np.empty((self.maxsize, embedding.shape[0]), dtype=np.float32)
+                self._values.clear()
+            
+            if len(self._values) < self.maxsize:
+                slot = len(self._values)
+            else:
+                slot, _ = self._values.popitem(last=False)
+            self._keys[slot] = embedding
+            self._values[slot] = value
+    
+    def clear(self):
+        """Drop every entry (e.g. after the index is rebuilt)"""
+        with self._lock:
+            self._values.clear()
+    
+    def stats(self) -> dict:
+        """Hit/miss counters, for tuning the threshold"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._values),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+    
+    def __len__(self) -> int:
+        return len(self._values)
@@ -0,0 +1,50 @@
+"""
+Image encoding helpers shared by the LLM vision calls
+"""
+
+import hashlib
+import io
+import threading
+from PIL import Image
+
+try:
+    # SIMD (SSE4/AVX2) base64 codec, same API as the stdlib module
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# One reusable JPEG buffer per thread, so concurrent requests never share it
+_local = threading.local()
+
+
+def encode_image_base64(image: Image.Image, max_size: int, quality: int = 75) -> str:
+    """Downscale image to fit within max_size and return it as a base64-encoded JPEG"""
+    # Not-yet-loaded JPEGs decode at a reduced DCT scale, as thumbnail() does (no-op otherwise)
+    image.draft("RGB", (max_size * 2, max_size * 2))
+    width, height = image.size
+    if max(width, height) > max_size:
+        # resize() returns a new image, so the caller's image is left alone without
+        # copying it at full resolution first (same filter and reducing gap as thumbnail())
+        scale = max_size / max(width, height)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(size, Image.Resampling.BICUBIC, reducing_gap=2.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    
+    image.save(buffer, format="JPEG", quality=quality, optimize=False)
+    with buffer.getbuffer() as view:
+        return base64.b64encode(view).decode("ascii")
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content hash of a decoded image, for caching per-upload results"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
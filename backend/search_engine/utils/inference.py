@@ -0,0 +1,33 @@
+"""
+Inference context shared by every CLIP forward pass
+"""
+
+from contextlib import contextmanager
+
+import torch
+import torch.nn.functional as F
+
+
+@contextmanager
+def inference_context(device: str, autocast: bool = True):
+    """torch.inference_mode plus mixed-precision autocast (fp16 on CUDA, bf16 on CPU) when autocast is set"""
+    with torch.inference_mode():
+        if not autocast:
+            # e.g. int8 dynamically quantized Linears, which only take float32 inputs
+            yield
+        elif device.startswith("cuda"):
+            with torch.autocast(device_type="cuda", dtype=torch.float16):
+                yield
+        elif device.startswith("cpu"):
+            with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+                yield
+        else:
+            # No autocast backend for this device (e.g. mps), run at the model's dtype
+            yield
+
+
+def unit_features(output) -> torch.Tensor:
+    """Projected features from a get_*_features() result, as L2-normalized float32"""
+    # Older transformers return the tensor itself, newer ones wrap it in a model output
+    feats = output if isinstance(output, torch.Tensor) else output.pooler_output
+    return F.normalize(feats.float(), dim=-1)
@@ -3,11 +3,13 @@ Jewelry Utilities for Type Detection and Description Generation
 """
 
 import os
-import base64
-import io
+import numpy as np
 import torch
 from PIL import Image
-from typing import Optional
+from typing import Optional, Union
+
+from .imaging import encode_image_base64
+from .inference import inference_context, unit_features
 
 try:
     from openai import OpenAI
@@ -15,14 +17,27 @@ try:
 except ImportError:
     OPENAI_AVAILABLE = False
 
+# EXIF tag holding the camera orientation (1 = upright)
+EXIF_ORIENTATION = 0x0112
+
 
 class JewelryUtils:
     """Utility functions for jewelry detection and description"""
     
-    def __init__(self, model, processor, device: str):
+    TYPE_QUERIES = ["a ring", "a necklace"]
+    
+    def __init__(self, model, processor, device: str, autocast: bool = True):
         self.model = model
         self.processor = processor
         self.device = device
+        self.autocast = autocast
+        
+        # The type-detection prompts never change, so encode them once up front
+        text_inputs = self.processor(text=self.TYPE_QUERIES, return_tensors="pt", padding=True).to(self.device)
+        with inference_context(self.device, self.autocast):
+            text_features = unit_features(self.model.get_text_features(**text_inputs))
+        # Host copy: scoring two prompts is a (2, D) matvec, not worth a device round trip
+        self._type_text_features = text_features.cpu().numpy()
         
         # Initialize OpenAI client for description generation
         self.openai_client = None
@@ -39,24 +54,23 @@ class JewelryUtils:
     def correct_image_rotation(self, image: Image.Image) -> Image.Image:
         """Correct image rotation using EXIF orientation data and auto-rotation"""
         try:
-            # First, handle EXIF orientation
-            from PIL import ImageOps
-            image = ImageOps.exif_transpose(image)
+            # First, handle EXIF orientation. exif_transpose() copies the pixels even for
+            # upright images, so only call it when the orientation tag says otherwise
+            if image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+                from PIL import ImageOps
+                image = ImageOps.exif_transpose(image)
             
             # Try to detect if image needs rotation by testing text readability at different angles
             if self.openai_client:
                 # Use a simple heuristic: check image dimensions
                 width, height = image.size
                 
-                # If significantly wider than tall, might be rotated
+                # If significantly wider than tall, might be rotated (tall images are left
+                # as is, portrait is common for jewelry)
                 if width > height * 1.5:
                     # Try rotating and see which orientation is better
                     print("🔄 Image appears rotated, attempting auto-correction...")
                     return image.rotate(90, expand=True)
-                elif height > width * 1.5:
-                    # Might be portrait orientation or rotated the other way
-                    # Keep as is for now - portrait is common for jewelry
-                    pass
             
             return image
             
@@ -64,36 +78,27 @@ class JewelryUtils:
             print(f"⚠️ Image rotation correction failed: {e}")
             return image
     
-    def detect_jewelry_type(self, image: Image.Image) -> Optional[str]:
-        """Detect if image is a ring or necklace using CLIP"""
+    def detect_jewelry_type_from_features(
+        self, image_features: Union[torch.Tensor, np.ndarray]
+    ) -> Optional[str]:
+        """Detect ring vs necklace from an already-computed, L2-normalized image embedding"""
         try:
-            # Correct rotation first for better detection
-            corrected_image = self.correct_image_rotation(image)
-            
-            type_queries = ["a ring", "a necklace"]
-            text_inputs = self.processor(text=type_queries, return_tensors="pt", padding=True).to(self.device)
-            image_inputs = self.processor(images=[corrected_image], return_tensors="pt").to(self.device)
-            
-            with torch.no_grad():
-                text_features = self.model.get_text_features(**text_inputs)
-                image_features = self.model.get_image_features(**image_inputs)
-                
-                # Normalize
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-                
-                # Compute similarity
-                similarities = (image_features @ text_features.T).squeeze(0)
-                
-                # Get best match
-                best_idx = similarities.argmax().item()
-                best_score = similarities[best_idx].item()
-                
-                # Only return if confident (> 0.25)
-                if best_score > 0.25:
-                    jewelry_type = type_queries[best_idx].replace("a ", "")
-                    print(f"🔍 Detected jewelry type: {jewelry_type} (confidence: {best_score:.2f})")
-                    return jewelry_type
+            if isinstance(image_features, torch.Tensor):
+                image_features = image_features.detach().float().cpu().numpy()
+            image_features = np.asarray(image_features, dtype=np.float32).reshape(-1)
+            
+            # Compute similarity (cosine, both sides are unit-norm)
+            similarities = self._type_text_features @ image_features
+            
+            # Get best match
+            best_idx = int(similarities.argmax())
+            best_score = float(similarities[best_idx])
+            
+            # Only return if confident (> 0.25)
+            if best_score > 0.25:
+                jewelry_type = self.TYPE_QUERIES[best_idx].replace("a ", "")
+                print(f"🔍 Detected jewelry type: {jewelry_type} (confidence: {best_score:.2f})")
+                return jewelry_type
         
         except Exception as e:
             print(f"⚠️  Type detection failed: {e}")
@@ -107,13 +112,9 @@ class JewelryUtils:
             return f"A beautiful {category} piece from our collection. This item showcases elegant craftsmanship and timeless design."
         
         try:
-            # Load and encode image
+            # Load and encode image (resized for API)
             with Image.open(image_path) as img:
-                # Resize for API
-                img.thumbnail((512, 512))
-                buffer = io.BytesIO()
-                img.save(buffer, format="JPEG")
-                img_base64 = base64.b64encode(buffer.getvalue()).decode()
+                img_base64 = encode_image_base64(img, 512)
             
             # Get model from env or use default
             model = os.getenv("OPENAI_MODEL", "gpt-4.1-nano")
@@ -149,7 +150,10 @@ class JewelryUtils:
             return f"An exquisite {category} featuring sophisticated design and premium quality. Perfect for adding elegance to any occasion."
     
     def extract_text_with_llm(self, image: Image.Image) -> Optional[str]:
-        """Extract text from image using LLM vision capabilities"""
+        """Extract text from image using LLM vision capabilities
+        
+        Returns "" when the image has no text, None when the LLM is unavailable or the call failed.
+        """
         if not OPENAI_AVAILABLE or not self.openai_client:
             print("⚠️ LLM text extraction unavailable - OpenAI client not configured")
             return None
@@ -158,12 +162,8 @@ class JewelryUtils:
             # Correct rotation first
             corrected_image = self.correct_image_rotation(image)
             
-            # Encode image for API
-            img_copy = corrected_image.copy()
-            img_copy.thumbnail((512, 512))
-            buffer = io.BytesIO()
-            img_copy.save(buffer, format="JPEG")
-            img_base64 = base64.b64encode(buffer.getvalue()).decode()
+            # Encode image for API (text stays legible at lower JPEG quality)
+            img_base64 = encode_image_base64(corrected_image, 512, quality=70)
             
             # Get model from env or use default
             model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
@@ -199,7 +199,7 @@ class JewelryUtils:
                 return extracted
             
             print("🤖 LLM found no text in image")
-            return None
+            return ""
             
         except Exception as e:
             print(f"⚠️ LLM text extraction failed: {e}")